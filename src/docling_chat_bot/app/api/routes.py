@@ -1,23 +1,42 @@
-import json
 import os
 import re
+import time
+from collections import defaultdict
+from operator import itemgetter
 from typing import List, Any, Dict
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
 from ..config.config import properties
-from ..doc_processor import DocProcessor
+from ..doc_processor import DocProcessor, chunks_to_rows
 from ..logger import logger
 from ..milvus import (
     milvus_store,
     recreate_collection,
-    search_embeddings,
+    search_embeddings_async,
     check_milvus_connection,
 )
 
 router = APIRouter()
 
+# Регулярки для разбора строки meta (legacy-формат без отдельного поля headings)
+_HEADINGS_RE = re.compile(r"headings=\[(.*?)]")
+_VALUES_RE = re.compile(r"'(.*?)'")
+
+# Шаблоны фильтров Milvus: пользовательские значения передаются через filter_params,
+# а не подставляются в строку выражения
+_DOC_FILTER = "metadata['document_name'] == {document_name}"
+_CHUNK_FILTER = _DOC_FILTER + " and metadata['chunk_index'] == {chunk_index}"
+_SECTION_FILTER = _DOC_FILTER + " and json_contains(metadata['headings'], {heading})"
+
+# Размер страницы query_iterator при чтении чанков раздела
+_QUERY_ITERATOR_BATCH_SIZE = 500
+
+# Кэш ответа /health: (время получения, ответ) — probe'ы не ходят в Milvus чаще раза в TTL
+_HEALTH_CACHE_TTL_SECONDS = 5.0
+_health_cache: "tuple[float, HealthResponse] | None" = None
+
 
 class SimilarRequest(BaseModel):
     query: str
@@ -75,83 +94,36 @@ def _extract_headings_from_meta(meta_str: str) -> list[str] | None:
     if not meta_str:
         return None
 
-    m = re.search(r"headings=\[(.*?)]", meta_str)
+    m = _HEADINGS_RE.search(meta_str)
     if not m:
         return None
 
     inside = m.group(1)
 
-    values = re.findall(r"'(.*?)'", inside)
+    values = _VALUES_RE.findall(inside)
     headings = [v.strip() for v in values if v.strip()]
 
     return headings or None
 
 
 def _headings_from_metadata(meta_full: Dict[str, Any]) -> list[str] | None:
-    """Extract headings from metadata JSON or embedded meta string."""
+    """Extract headings from metadata JSON (legacy rows: from embedded meta string)."""
 
     if not meta_full:
         return None
 
-    if "headings" in meta_full and isinstance(meta_full["headings"], list):
-        normalized: list[str] = []
-        for h in meta_full["headings"]:
-            text = str(h).strip()
-            if text:
-                normalized.append(text)
-        if normalized:
-            return normalized
-
-    if "meta" in meta_full and isinstance(meta_full["meta"], str):
-        return _extract_headings_from_meta(meta_full["meta"])
-
-    return None
-
-
-def _extract_text_and_metadata(chunk: Any, idx: int, document_name: str) -> tuple[str, Dict[str, Any]]:
-    """
-    Достаём текст и полную metadata из docling chunk.
-    """
-    text = ""
-    for attr in ("text", "content", "page_content"):
-        if hasattr(chunk, attr):
-            val = getattr(chunk, attr)
-            if val:
-                text = str(val)
-                break
-    if not text:
-        text = str(chunk)
-    text = text.strip()
-
-    meta = {}
-
-    if hasattr(chunk, "__dict__"):
-        for key, value in chunk.__dict__.items():
-            if key in ("doc_items", "origin", "model_fields", "model_config", "model_extra", "model_computed_fields"):
-                continue
-            try:
-                json.dumps(value)
-                meta[key] = value
-            except Exception:
-                meta[key] = str(value)
-
-    # headings нормализуем
-    if "headings" in meta:
-        try:
-            meta["headings"] = [str(h) for h in meta["headings"]] if isinstance(meta["headings"], list) else []
-        except:
-            meta["headings"] = []
-
-    # chunk index
-    meta["chunk_index"] = idx
+    if "headings" not in meta_full:
+        # Миграционный fallback для коллекций, проиндексированных до появления поля headings
+        if isinstance(meta_full.get("meta"), str):
+            return _extract_headings_from_meta(meta_full["meta"])
+        return None
 
-    # document name
-    meta["document_name"] = document_name
+    return meta_full["headings"] or None
 
-    # source
-    meta.setdefault("source", "docling_upload")
 
-    return text, meta
+def _invalidate_health_cache() -> None:
+    global _health_cache
+    _health_cache = None
 
 
 @router.get("/health", response_model=HealthResponse)
@@ -160,25 +132,35 @@ def health():
     Простая health-проверка Milvus + загружена ли коллекция.
 
     doc_loaded: True, если коллекция существует и в ней есть хотя бы один объект.
+    Ответ кэшируется на _HEALTH_CACHE_TTL_SECONDS (в том числе degraded).
     """
+    global _health_cache
+
+    now = time.monotonic()
+    if _health_cache is not None and now - _health_cache[0] < _HEALTH_CACHE_TTL_SECONDS:
+        return _health_cache[1]
+
     milvus_ok = check_milvus_connection()
 
-    try:
-        stats = milvus_store.client.get_collection_stats(
-            collection_name=properties.MILVUS_COLLECTION_NAME
-        )
-        row_count = int(stats.get("row_count", "0"))
-        doc_loaded = row_count > 0
-    except Exception:
-        doc_loaded = False
+    doc_loaded = False
+    if milvus_ok:
+        try:
+            stats = milvus_store.client.get_collection_stats(
+                collection_name=properties.MILVUS_COLLECTION_NAME
+            )
+            doc_loaded = int(stats.get("row_count", "0")) > 0
+        except Exception:
+            doc_loaded = False
 
     status = "ok" if milvus_ok and doc_loaded else "degraded"
 
-    return HealthResponse(
+    response = HealthResponse(
         status=status,
         milvus_ok=milvus_ok,
         doc_loaded=doc_loaded,
     )
+    _health_cache = (now, response)
+    return response
 
 
 @router.post("/api/v1/doc/index", response_model=IndexResponse)
@@ -199,9 +181,12 @@ def index_document():
         )
 
     # Собираем список .docx файлов
-    doc_files: list[str] = [
-        f for f in os.listdir(upload_dir_abs) if f.lower().endswith(".docx")
-    ]
+    with os.scandir(upload_dir_abs) as entries:
+        doc_files: list[str] = [
+            e.name
+            for e in entries
+            if e.name[-5:].lower() == ".docx" and e.is_file()
+        ]
 
     if not doc_files:
         logger.error(f"No .docx files found in '{upload_dir_abs}'")
@@ -210,59 +195,65 @@ def index_document():
     # Пересоздаём коллекцию
     logger.info("Recreating Milvus collection before indexing...")
     recreate_collection()
-
-    processor = DocProcessor()
-
-    texts: List[str] = []
-    metadatas: List[Dict[str, Any]] = []
-
-    # Обрабатываем каждый документ из uploads
-    for filename in sorted(doc_files):
-        doc_path = os.path.join(upload_dir_abs, filename)
-        logger.info(f"Processing document for indexing: {doc_path}")
-
+    _invalidate_health_cache()
+
+    # Чанки копим только до MILVUS_INSERT_BATCH_SIZE и сразу сбрасываем в Milvus,
+    # пока остальные документы ещё конвертируются
+    batch_size = max(1, properties.MILVUS_INSERT_BATCH_SIZE)
+    batch_texts: List[str] = []
+    batch_metas: List[Dict[str, Any]] = []
+    inserted = 0
+
+    def _flush() -> None:
+        nonlocal inserted
+        if not batch_texts:
+            return
+        logger.info(
+            f"Inserting {len(batch_texts)} chunks into Milvus via milvus_store.add_texts(...)"
+        )
         try:
-            chunks = processor.process_single_file(doc_path, filename)
+            milvus_store.add_texts(texts=batch_texts, metadatas=batch_metas)
         except Exception as e:
             logger.error(
-                f"Failed to process document '{doc_path}': {e}",
+                f"Failed to insert chunks into Milvus ({inserted} chunks already inserted): {e}",
                 exc_info=True,
             )
-            continue
-
-        if not chunks:
-            logger.warning(f"No chunks produced for document '{doc_path}'")
-            continue
-
-        for idx, chunk in enumerate(chunks):
-            text, metadata = _extract_text_and_metadata(chunk, idx, document_name=filename)
-
-            if not text:
-                continue
-
-            texts.append(text)
-            metadatas.append(metadata)
-
-    if not texts:
+            raise HTTPException(status_code=500, detail=f"Failed to insert chunks into Milvus: {e}")
+        inserted += len(batch_texts)
+        batch_texts.clear()
+        batch_metas.clear()
+
+    # Обрабатываем документы из uploads параллельно: docling-конвертация упирается в CPU
+    items = [
+        (os.path.join(upload_dir_abs, filename), filename)
+        for filename in sorted(doc_files)
+    ]
+    for _, (file_texts, file_metadatas) in DocProcessor.process_files(items, transform=chunks_to_rows):
+        # Переносим срезами известной длины: один resize на срез вместо append на каждый чанк
+        pos = 0
+        while pos < len(file_texts):
+            end = pos + batch_size - len(batch_texts)
+            batch_texts.extend(file_texts[pos:end])
+            batch_metas.extend(file_metadatas[pos:end])
+            pos = end
+            if len(batch_texts) >= batch_size:
+                _flush()
+
+    _flush()
+
+    if not inserted:
         logger.warning("No non-empty chunks to index after processing all documents")
         return IndexResponse(inserted=0)
 
-    # Записываем в Milvus через langchain Milvus store
-    logger.info(f"Inserting {len(texts)} chunks into Milvus via milvus_store.add_texts(...)")
-    try:
-        milvus_store.add_texts(texts=texts, metadatas=metadatas)
-    except Exception as e:
-        logger.error(f"Failed to insert chunks into Milvus: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Failed to insert chunks into Milvus: {e}")
-
+    _invalidate_health_cache()
     logger.info(
-        f"Successfully indexed {len(texts)} chunks into collection '{properties.MILVUS_COLLECTION_NAME}'"
+        f"Successfully indexed {inserted} chunks into collection '{properties.MILVUS_COLLECTION_NAME}'"
     )
-    return IndexResponse(inserted=len(texts))
+    return IndexResponse(inserted=inserted)
 
 
 @router.post("/api/v1/doc/similar", response_model=SimilarResponse)
-def similar(payload: SimilarRequest):
+async def similar(payload: SimilarRequest):
     """
     Поиск похожих чанков по запросу пользователя.
     Использует search_embeddings из milvus.py (Yandex + MilvusClient.search).
@@ -270,7 +261,7 @@ def similar(payload: SimilarRequest):
     logger.info(f"Searching similar for query='{payload.query}', top_k={payload.top_k}")
 
     try:
-        raw_results = search_embeddings(payload.query, payload.top_k)
+        raw_results = await search_embeddings_async(payload.query, payload.top_k)
     except Exception as e:
         logger.error(f"Milvus search failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Milvus search failed: {e}")
@@ -280,10 +271,9 @@ def similar(payload: SimilarRequest):
         meta_full = r.get("metadata") or {}
 
         meta_public = {}
-        if "meta" in meta_full and isinstance(meta_full["meta"], str):
-            headings = _extract_headings_from_meta(meta_full["meta"])
-            if headings:
-                meta_public["headings"] = headings
+        headings = _headings_from_metadata(meta_full)
+        if headings:
+            meta_public["headings"] = headings
         if "document_name" in meta_full:
             meta_public["document_name"] = meta_full["document_name"]
         if "chunk_index" in meta_full:
@@ -314,19 +304,37 @@ def chunks_by_heading(payload: SectionChunksRequest):
     else:
         depth_requested = payload.depth
 
-    try:
-        doc_chunks = milvus_store.client.query(
+    doc_params: Dict[str, Any] = {"document_name": payload.document_name}
+
+    def _query(filter_expr: str, params: Dict[str, Any], limit: int) -> list[Dict[str, Any]]:
+        try:
+            return milvus_store.client.query(
+                collection_name=properties.MILVUS_COLLECTION_NAME,
+                filter=filter_expr,
+                filter_params=params,
+                output_fields=["text", "metadata"],
+                limit=limit,
+            )
+        except Exception as e:
+            logger.error(f"Milvus query failed: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Milvus query failed: {e}")
+
+    def _query_all(filter_expr: str, params: Dict[str, Any]) -> list[Dict[str, Any]]:
+        # query_iterator не маппит filter_params, но пробрасывает expr_params в каждый query
+        iterator = milvus_store.client.query_iterator(
             collection_name=properties.MILVUS_COLLECTION_NAME,
-            filter=f"metadata['document_name'] == \"{payload.document_name}\"",
+            filter=filter_expr,
+            expr_params=params,
             output_fields=["text", "metadata"],
-            limit=10000,
+            batch_size=_QUERY_ITERATOR_BATCH_SIZE,
         )
-    except Exception as e:
-        logger.error(f"Milvus query failed: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Milvus query failed: {e}")
-
-    if not doc_chunks:
-        raise HTTPException(status_code=404, detail="Document not found in Milvus")
+        rows: list[Dict[str, Any]] = []
+        try:
+            while page := iterator.next():
+                rows.extend(page)
+        finally:
+            iterator.close()
+        return rows
 
     def _as_int(val: Any) -> int | None:
         try:
@@ -334,16 +342,19 @@ def chunks_by_heading(payload: SectionChunksRequest):
         except Exception:
             return None
 
-    target_chunk = None
-    for ch in doc_chunks:
-        meta = (ch.get("metadata") or {}) if isinstance(ch, dict) else {}
-        if _as_int(meta.get("chunk_index")) == payload.chunk_index:
-            target_chunk = ch
-            break
+    # Сначала точечно достаём только целевой чанк, а не весь документ
+    target_rows = _query(
+        _CHUNK_FILTER,
+        {**doc_params, "chunk_index": payload.chunk_index},
+        limit=1,
+    )
 
-    if not target_chunk:
+    if not target_rows:
+        if not _query(_DOC_FILTER, doc_params, limit=1):
+            raise HTTPException(status_code=404, detail="Document not found in Milvus")
         raise HTTPException(status_code=404, detail="Chunk not found in document")
 
+    target_chunk = target_rows[0]
     target_meta = target_chunk.get("metadata") or {}
     headings = _headings_from_metadata(target_meta)
 
@@ -358,29 +369,57 @@ def chunks_by_heading(payload: SectionChunksRequest):
     depth_used = min(depth_requested, len(headings))
     target_heading = headings[-depth_used]
 
-    matches: list[SectionChunkHit] = []
-    for ch in doc_chunks:
+    # Чанки раздела читаем постранично, без жёсткого limit, который обрезал большие документы
+    doc_chunks: list[Dict[str, Any]] | None = None
+    if "headings" in target_meta:
+        # Фильтр по разделу выполняется на стороне Milvus через JSON-оператор
+        try:
+            doc_chunks = _query_all(_SECTION_FILTER, {**doc_params, "heading": target_heading})
+        except Exception as e:
+            logger.warning(f"Milvus json_contains query failed, falling back to full document scan: {e}")
+
+    if doc_chunks is None:
+        try:
+            doc_chunks = _query_all(_DOC_FILTER, doc_params)
+        except Exception as e:
+            logger.error(f"Milvus query failed: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Milvus query failed: {e}")
+
+    # Один проход: раздел -> позиции чанков в doc_chunks, затем O(1) выборка по целевому разделу
+    metas: list[Dict[str, Any]] = []
+    chunk_headings_list: list[list[str]] = []
+    heading_index: Dict[str, list[int]] = defaultdict(list)
+    for pos, ch in enumerate(doc_chunks):
         meta = (ch.get("metadata") or {}) if isinstance(ch, dict) else {}
         chunk_headings = _headings_from_metadata(meta) or []
+        metas.append(meta)
+        chunk_headings_list.append(chunk_headings)
+        for heading in set(chunk_headings):
+            heading_index[heading].append(pos)
 
-        if target_heading not in chunk_headings:
-            continue
+    # Пары (chunk_index, hit): сортируем по готовому int, без обращения к атрибутам модели
+    matches: list[tuple[int, SectionChunkHit]] = []
+    for pos in heading_index.get(target_heading, []):
+        meta = metas[pos]
+        chunk_headings = chunk_headings_list[pos]
 
         idx_val = _as_int(meta.get("chunk_index"))
+        if idx_val is None:
+            idx_val = -1
         match = SectionChunkHit(
-            chunk_index=idx_val if idx_val is not None else -1,
+            chunk_index=idx_val,
             document_name=str(meta.get("document_name", payload.document_name)),
-            text=ch.get("text"),
+            text=doc_chunks[pos].get("text"),
             headings=chunk_headings or None,
             metadata=meta or None,
         )
-        matches.append(match)
+        matches.append((idx_val, match))
 
-    matches.sort(key=lambda m: m.chunk_index)
+    matches.sort(key=itemgetter(0))
 
     return SectionChunksResponse(
         depth_used=depth_used,
         target_heading=target_heading,
-        results=matches,
+        results=[match for _, match in matches],
         message=None,
     )
@@ -0,0 +1,20 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+# Общий ограниченный пул для блокирующих сетевых вызовов (embeddings, tokenize, Milvus)
+BLOCKING_IO_MAX_WORKERS = 32
+
+blocking_executor = ThreadPoolExecutor(
+    max_workers=BLOCKING_IO_MAX_WORKERS,
+    thread_name_prefix="blocking-io",
+)
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Выполняет блокирующую функцию в blocking_executor, не занимая event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, partial(func, *args, **kwargs))
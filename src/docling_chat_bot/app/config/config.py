@@ -1,6 +1,9 @@
 """
 App configuration using Pydantic Settings for type safety, validation and environment variable support
 """
+from functools import lru_cache
+from typing import Any, Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -16,6 +19,24 @@ class Settings(BaseSettings):
     MILVUS_DB_NAME: str
     # Milvus collection name for storing vectors
     MILVUS_COLLECTION_NAME: str
+    # Number of chunks sent to Milvus in a single insert call
+    MILVUS_INSERT_BATCH_SIZE: int = 1000
+    # Vector index type: IVF_SQ8 stores vectors as int8 (dim*1 bytes per vector instead of dim*4),
+    # HNSW keeps full FP32 vectors in a graph index, FLAT is an exact scan,
+    # AUTO (default) picks FLAT below 100K rows and HNSW above, judged by the collection being replaced
+    MILVUS_INDEX_TYPE: Literal["IVF_SQ8", "HNSW", "FLAT", "AUTO"] = "AUTO"
+    # JSON object overriding search-time index params, e.g. {"ef": 128} or {"nprobe": 32}
+    MILVUS_SEARCH_PARAMS: dict[str, Any] | None = None
+    # Number of IVF clusters built for the vector index
+    MILVUS_IVF_NLIST: int = 128
+    # Number of IVF clusters scanned at search time
+    MILVUS_IVF_NPROBE: int = 16
+    # HNSW graph degree (max links per node) for the vector index
+    MILVUS_HNSW_M: int = 16
+    # HNSW candidate list size while building the index
+    MILVUS_HNSW_EF_CONSTRUCTION: int = 200
+    # HNSW candidate list size at search time (raised to top_k if smaller)
+    MILVUS_HNSW_EF: int = 64
     # Username for protect milvus
     MILVUS_USERNAME: str = "root"
     # Password for protect milvus
@@ -28,6 +49,8 @@ class Settings(BaseSettings):
     LLM_MODEL_NAME: str
     # Model catalog id to connect llm server
     LLM_CATALOG_ID_YANDEX: str
+    # Embedding vector size; probed once from the embeddings API when not set
+    LLM_EMBEDDING_DIM: int | None = None
     # seconds
     LLM_REQUEST_TIMEOUT: int = 120
     # seconds
@@ -65,5 +88,11 @@ class Settings(BaseSettings):
         extra='ignore'
     )
 
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Parse .env and environment once; call get_settings.cache_clear() to re-read."""
+    return Settings()
+
+
 # Create settings instance
-properties = Settings()
\ No newline at end of file
+properties = get_settings()
@@ -1,15 +1,35 @@
+import inspect
+import logging
+import multiprocessing
+import os
 import time
-from typing import List, Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
 
 import docling.backend.msword_backend as msb  # type: ignore
+import orjson
 from docling.chunking import HybridChunker
 from docling.document_converter import DocumentConverter, InputFormat, WordFormatOption
+from pydantic import BaseModel
 
 from .logger import logger
 from .tokenization import YandexTokenizer
 
 # Флаг, чтобы патчить обработчик формул только один раз
 _EQUATIONS_PATCHED: bool = False
+# Класс msword_backend, в котором подменён обработчик формул
+_PATCHED_CLS: type | None = None
+
+# Поля docling chunk, которые не попадают в metadata
+_CHUNK_SKIP_KEYS = frozenset(
+    ("doc_items", "origin", "model_fields", "model_config", "model_extra", "model_computed_fields")
+)
+_JSON_SCALAR_TYPES = (str, int, float, bool, type(None))
+_CHUNK_DUMP_EXCLUDE = {"doc_items": True, "origin": True, "meta": {"doc_items", "origin"}}
+
+# Воркеры индексации запускаем через spawn: fork копировал бы потоки gRPC/HTTP-клиентов
+# родителя, а spawn одинаково ведёт себя на всех платформах и версиях Python
+_MP_CONTEXT = multiprocessing.get_context("spawn")
 
 
 def _disable_equations(*args, **kwargs):
@@ -25,50 +45,181 @@ def _patch_equations() -> None:
     Находим в msword_backend класс(ы) с методом _handle_equations_in_text
     и подменяем этот метод на _disable_equations.
     """
-    global _EQUATIONS_PATCHED
+    global _EQUATIONS_PATCHED, _PATCHED_CLS
     if _EQUATIONS_PATCHED:
         return
 
     try:
-        for name, obj in msb.__dict__.items():
-            if isinstance(obj, type) and "_handle_equations_in_text" in obj.__dict__:
-                logger.debug(f"Patching equation handler for {obj}")
-                obj._handle_equations_in_text = _disable_equations  # type: ignore[attr-defined]
-                _EQUATIONS_PATCHED = True
-                break
-
-        if not _EQUATIONS_PATCHED:
+        _PATCHED_CLS = next(
+            (
+                cls
+                for _, cls in inspect.getmembers(msb, inspect.isclass)
+                if cls.__module__ == msb.__name__ and "_handle_equations_in_text" in cls.__dict__
+            ),
+            None,
+        )
+
+        if _PATCHED_CLS is None:
             logger.warning(
                 "Could not find _handle_equations_in_text in msword_backend; "
                 "equation patch was not applied."
             )
+            return
+
+        logger.debug(f"Patching equation handler for {_PATCHED_CLS}")
+        _PATCHED_CLS._handle_equations_in_text = _disable_equations  # type: ignore[attr-defined]
+        _EQUATIONS_PATCHED = True
     except Exception as e:
         logger.error(f"Failed to patch equation handler: {e}", exc_info=True)
 
 
+# Патчим при импорте модуля, в том числе в каждом воркер-процессе индексации;
+# вызов из DocProcessor.__init__ после этого — дешёвая проверка флага
+_patch_equations()
+
+
+def _chunk_headings(chunk: Any) -> list[str]:
+    """Достаём headings напрямую из docling chunk (chunk.meta.headings)."""
+
+    doc_meta = getattr(chunk, "meta", None)
+    raw = getattr(doc_meta, "headings", None)
+    if raw is None and isinstance(getattr(chunk, "metadata", None), dict):
+        raw = chunk.metadata.get("headings")
+    if not isinstance(raw, list):
+        return []
+
+    headings: list[str] = []
+    for h in raw:
+        text = str(h).strip()
+        if text:
+            headings.append(text)
+    return headings
+
+
+def _is_jsonable(value: Any) -> bool:
+    """Дешёвая проверка сериализуемости: скаляры по типу, orjson.dumps только для контейнеров."""
+
+    if isinstance(value, _JSON_SCALAR_TYPES):
+        return True
+    if isinstance(value, (list, dict)):
+        try:
+            orjson.dumps(value)
+            return True
+        except TypeError:
+            return False
+    return False
+
+
+def _extract_text(chunk: Any) -> str:
+    """
+    Достаём текст из docling chunk.
+    """
+    text = (
+        getattr(chunk, "text", None)
+        or getattr(chunk, "content", None)
+        or getattr(chunk, "page_content", None)
+        or chunk
+    )
+    return str(text).strip()
+
+
+def _extract_metadata(chunk: Any, idx: int, document_name: str) -> Dict[str, Any]:
+    """
+    Достаём полную metadata из docling chunk. Вызывается только для чанков с непустым текстом.
+    """
+    meta = {}
+
+    if isinstance(chunk, BaseModel):
+        # docling DocChunk — pydantic-модель: mode="json" сразу даёт сериализуемые значения,
+        # тяжёлые doc_items/origin исключаем и внутри meta
+        meta.update(chunk.model_dump(mode="json", exclude=_CHUNK_DUMP_EXCLUDE))
+    elif hasattr(chunk, "__dict__"):
+        for key, value in chunk.__dict__.items():
+            if key in _CHUNK_SKIP_KEYS:
+                continue
+            meta[key] = value if _is_jsonable(value) else str(value)
+
+    # headings храним отдельным JSON-полем, чтобы при чтении не разбирать строку meta
+    meta["headings"] = _chunk_headings(chunk)
+
+    # chunk index
+    meta["chunk_index"] = idx
+
+    # document name
+    meta["document_name"] = document_name
+
+    # source
+    meta.setdefault("source", "docling_upload")
+
+    return meta
+
+
+def chunks_to_rows(chunks: Iterable, filename: str) -> tuple[List[str], List[Dict[str, Any]]]:
+    """
+    Выполняется в воркер-процессе DocProcessor.process_files: возвращает тексты и metadata
+    непустых чанков (сами docling-чанки между процессами не передаём).
+    Живёт здесь, а не в api.routes, чтобы воркер не импортировал milvus и не открывал
+    соединения с Milvus и embeddings API.
+    """
+    # Пустые чанки отбрасываем до сборки metadata
+    pairs = [
+        (text, _extract_metadata(chunk, idx, document_name=filename))
+        for idx, chunk in enumerate(chunks)
+        if (text := _extract_text(chunk))
+    ]
+    texts: List[str] = [text for text, _ in pairs]
+    metadatas: List[Dict[str, Any]] = [metadata for _, metadata in pairs]
+
+    if not texts:
+        logger.warning(f"No chunks produced for document '{filename}'")
+
+    return texts, metadatas
+
+
+# DocProcessor воркер-процесса: создаётся при первом файле и переиспользуется для следующих
+_worker_processor: "DocProcessor | None" = None
+
+
+def _process_in_worker(
+    path: str,
+    filename: str,
+    transform: Callable[[Iterator, str], Any] | None,
+) -> Any:
+    global _worker_processor
+    if _worker_processor is None:
+        _worker_processor = DocProcessor()
+    chunks = _worker_processor.process_single_file(path, filename)
+    return transform(chunks, filename) if transform else list(chunks)
+
+
 class DocProcessor:
     """
-    Простой процессор, который умеет обработать один DOCX-файл и вернуть список чанков.
+    Простой процессор, который умеет обработать один DOCX-файл и отдать его чанки.
 
     Использование:
         processor = DocProcessor()
-        chunks = processor.process_single_file("/app/uploads/WKR.docx", "WKR.docx")
+        for chunk in processor.process_single_file("/app/uploads/WKR.docx", "WKR.docx"):
+            ...
     """
 
     def __init__(self) -> None:
         _patch_equations()
-
-    def process_single_file(self, path: str, filename: str) -> List:
-        logger.info(f"Converting DOCX with docling: {path}")
-
-        _patch_equations()
-
-        converter = DocumentConverter(
+        # Конвертер, токенизатор и чанкер создаём один раз и переиспользуем для всех файлов
+        self._converter = DocumentConverter(
             format_options={InputFormat.DOCX: WordFormatOption()}
         )
+        self._tokenizer = YandexTokenizer()
+        self._chunker = HybridChunker(tokenizer=self._tokenizer)
+
+    def process_single_file(self, path: str, filename: str) -> Iterator:
+        """
+        Конвертирует документ сразу (ошибки конвертации поднимаются при вызове),
+        а чанки отдаёт лениво — по мере работы HybridChunker.
+        """
+        logger.info(f"Converting DOCX with docling: {path}")
 
         try:
-            result = converter.convert(path)
+            result = self._converter.convert(path)
         except Exception as e:
             logger.error(f"Failed to convert document '{path}': {e}", exc_info=True)
             raise
@@ -77,7 +228,7 @@ class DocProcessor:
         logger.info("Document successfully converted to docling representation")
 
         # Токен-осведомлённое чанкование
-        tokenizer = YandexTokenizer()
+        tokenizer = self._tokenizer
         max_tokens = tokenizer.get_max_tokens()
         logger.info(
             "Running HybridChunker with Yandex tokenizer (connect_timeout=%ss, read_timeout=%ss, max_tokens=%s)...",
@@ -85,6 +236,7 @@ class DocProcessor:
             tokenizer.timeout_seconds,
             max_tokens,
         )
+        # Доступность берём из кэша токенизатора с истечением, а не фиксируем при создании
         if not tokenizer._is_api_reachable():
             logger.warning(
                 "Yandex tokenize endpoint %s is not reachable; HybridChunker will use "
@@ -92,31 +244,44 @@ class DocProcessor:
                 tokenizer.api_url,
             )
 
-        chunker = HybridChunker(tokenizer=tokenizer)
+        return self._iter_chunks(self._chunker, doc, filename, max_tokens)
 
+    @staticmethod
+    def _iter_chunks(chunker: HybridChunker, doc, filename: str, max_tokens: int) -> Iterator:
         start_time = time.perf_counter()
-        chunks = []
+        count = 0
         try:
+            debug_enabled = logger.isEnabledFor(logging.DEBUG)
             for idx, chunk in enumerate(chunker.chunk(doc)):
-                chunk_text: Optional[str] = getattr(chunk, "text", None) or getattr(
-                    chunk, "content", None
-                )
-                text_preview = (chunk_text or "").strip().replace("\n", " ")
-                if len(text_preview) > 120:
-                    text_preview = text_preview[:117] + "..."
-
-                meta_summary = getattr(chunk, "metadata", {}) or {}
-                heading_meta = meta_summary.get("headings") or meta_summary.get(
-                    "heading"
-                )
-                logger.debug(
-                    "Chunk %s: text_len=%s, headings=%s, preview='%s'",
-                    idx,
-                    len(chunk_text or ""),
-                    heading_meta,
-                    text_preview,
-                )
-                chunks.append(chunk)
+                chunk_metadata = getattr(chunk, "metadata", None)
+
+                # Превью и сводку строим только если DEBUG действительно пишется
+                if debug_enabled:
+                    chunk_text: Optional[str] = getattr(chunk, "text", None) or getattr(
+                        chunk, "content", None
+                    )
+                    text_preview = (chunk_text or "").strip().replace("\n", " ")
+                    if len(text_preview) > 120:
+                        text_preview = text_preview[:117] + "..."
+
+                    meta_summary = chunk_metadata or {}
+                    heading_meta = meta_summary.get("headings") or meta_summary.get(
+                        "heading"
+                    )
+                    logger.debug(
+                        "Chunk %s: text_len=%s, headings=%s, preview='%s'",
+                        idx,
+                        len(chunk_text or ""),
+                        heading_meta,
+                        text_preview,
+                    )
+
+                # Добавим имя документа в метаданные чанка
+                if isinstance(chunk_metadata, dict):
+                    chunk_metadata.setdefault("document_name", filename)
+
+                count += 1
+                yield chunk
         except Exception:
             logger.error("HybridChunker failed while chunking the document", exc_info=True)
             raise
@@ -124,17 +289,42 @@ class DocProcessor:
         elapsed = time.perf_counter() - start_time
         logger.info(
             "Document chunked into %s segments in %.2fs (max_tokens=%s)",
-            len(chunks),
+            count,
             elapsed,
             max_tokens,
         )
 
-        # Добавим имя документа в метаданные каждого чанка
-        for ch in chunks:
-            try:
-                if hasattr(ch, "metadata") and isinstance(ch.metadata, dict):
-                    ch.metadata.setdefault("document_name", filename)
-            except Exception:
-                continue
+    @staticmethod
+    def process_files(
+        items: Sequence[tuple[str, str]],
+        transform: Callable[[Iterator, str], Any] | None = None,
+    ) -> Iterator[tuple[str, Any]]:
+        """
+        Обрабатывает пары (path, filename) в пуле процессов и отдаёт (path, результат)
+        по мере готовности. transform(chunks, filename) выполняется прямо в воркере —
+        так наружу уходят только его (picklable) результаты; без него — список чанков.
+        Файлы, которые не удалось обработать, логируются и пропускаются.
+        """
+        if not items:
+            return
+
+        executor = ProcessPoolExecutor(
+            max_workers=min(len(items), os.cpu_count() or 1),
+            mp_context=_MP_CONTEXT,
+        )
+        try:
+            futures = {}
+            for path, filename in items:
+                logger.info(f"Processing document for indexing: {path}")
+                futures[executor.submit(_process_in_worker, path, filename, transform)] = path
 
-        return chunks
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to process document '{path}': {e}", exc_info=True)
+                    continue
+                yield path, result
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -1,13 +1,23 @@
 import logging
+import os
+
+# Log level from a real environment variable: the logger is configured before Settings,
+# so LOG_LEVEL in .env is only picked up when the process manager exports it (e.g. env_file).
+# DEBUG lines are not formatted unless enabled explicitly; unknown values fall back to INFO.
+_RAW_LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVEL = _RAW_LOG_LEVEL.strip().upper()
+_LOG_LEVEL_VALID = LOG_LEVEL in logging.getLevelNamesMapping()
+if not _LOG_LEVEL_VALID:
+    LOG_LEVEL = "INFO"
 
 # Creating a named logger
 logger = logging.getLogger("docling_api")
-logger.setLevel(logging.DEBUG)
+logger.setLevel(LOG_LEVEL)
 logger.propagate = False
 
 # Console handler for outputting logs to stdout
 console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
+console_handler.setLevel(LOG_LEVEL)
 
 # Define log format
 formatter = logging.Formatter(
@@ -19,3 +29,6 @@ console_handler.setFormatter(formatter)
 # Avoid adding multiple handlers if this module is reimported
 if not logger.hasHandlers():
     logger.addHandler(console_handler)
+
+if not _LOG_LEVEL_VALID:
+    logger.warning("Unknown LOG_LEVEL %r, using INFO", _RAW_LOG_LEVEL)
@@ -1,30 +1,75 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
+import openai
 from langchain_milvus.vectorstores import Milvus
 from langchain_openai import OpenAIEmbeddings
+from pydantic import PrivateAttr
 from pymilvus import MilvusClient, DataType
 
+from .concurrency import run_blocking
 from .config.config import properties
 from .logger import logger
-
-TEXT_EMBEDDING_DIM = "тест"
+from .milvus_index import index_build_params, index_search_params, resolve_index_type
+
+# Embedding size from a probe request, used when LLM_EMBEDDING_DIM is not set
+_EMBED_DIM: int | None = None
+
+# The index type is re-read after this long, so workers that did not run
+# recreate_collection pick up the new collection's type
+INDEX_TYPE_TTL_SECONDS = 60.0
+# (index type, time.monotonic() expiry) of the current collection; see _current_index_type
+_INDEX_TYPE: tuple[str, float] | None = None
+
+# Number of texts sent in one embeddings API request
+EMBED_BATCH_SIZE = 96
+# Concurrent requests when the endpoint rejects a list of texts
+EMBED_MAX_CONCURRENCY = 8
+# Errors OpenAI-compatible servers return for list input they do not support:
+# 400 Bad Request, 404 Not Found and 422 Unprocessable Entity
+_BATCH_INPUT_REJECTED = (
+    openai.BadRequestError,
+    openai.NotFoundError,
+    openai.UnprocessableEntityError,
+)
 
 
 class CustomOpenAIEmbeddings(OpenAIEmbeddings):
+    _batch_input_supported: bool = PrivateAttr(default=True)
+    # embeddings.create params without "model", built once instead of per request
+    _embed_params: dict = PrivateAttr(default_factory=dict)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self._invocation_params["encoding_format"] = "float"
+        self._embed_params = {k: v for k, v in self._invocation_params.items() if k != "model"}
+        self._embed_params["encoding_format"] = "float"
 
     def embed_documents(self, texts: List[str], chunk_size: int | None = None) -> List[List[float]]:
-        # Ignoring chunk_size parameter
-        return [self.embed_query(text) for text in texts]
+        batch_size = chunk_size or EMBED_BATCH_SIZE
+        embeddings: List[List[float]] = []
+        for start in range(0, len(texts), batch_size):
+            embeddings.extend(self._embed_batch(texts[start:start + batch_size]))
+        return embeddings
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        if self._batch_input_supported:
+            try:
+                response = self.client.create(model=self.model, input=texts, **self._embed_params)
+                return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+            except _BATCH_INPUT_REJECTED as e:
+                logger.warning(
+                    f"Embeddings endpoint rejected batched input ({e}); "
+                    f"falling back to concurrent per-text requests"
+                )
+                self._batch_input_supported = False
+
+        with ThreadPoolExecutor(max_workers=min(len(texts), EMBED_MAX_CONCURRENCY)) as executor:
+            return list(executor.map(self.embed_query, texts))
 
     def embed_query(self, text: str) -> List[float]:
-        invocation_params = self._invocation_params.copy()
-        if "model" in invocation_params:
-            del invocation_params["model"]
-        invocation_params["encoding_format"] = "float"
-        response = self.client.create(model=self.model, input=text, **invocation_params)
+        response = self.client.create(model=self.model, input=text, **self._embed_params)
         return response.data[0].embedding
 
 
@@ -49,7 +94,53 @@ milvus_store = Milvus(
 )
 
 
+def _embedding_dim() -> int:
+    """Embedding size from config; otherwise one probe request per process."""
+    global _EMBED_DIM
+
+    if properties.LLM_EMBEDDING_DIM:
+        return int(properties.LLM_EMBEDDING_DIM)
+
+    if _EMBED_DIM is None:
+        logger.info("LLM_EMBEDDING_DIM is not set; probing embeddings API for vector size")
+        _EMBED_DIM = len(milvus_store.embeddings.embed_query("dimension probe"))
+    return _EMBED_DIM
+
+
+def _describe_index_type() -> str | None:
+    """Read the index type of the 'vector' field from Milvus, whatever the index is named."""
+    client: MilvusClient = milvus_store.client
+    collection_name = properties.MILVUS_COLLECTION_NAME
+
+    index_names = client.list_indexes(collection_name=collection_name, field_name="vector")
+    if not index_names:
+        return None
+    info = client.describe_index(collection_name=collection_name, index_name=index_names[0])
+    return info.get("index_type")
+
+
+def _current_index_type() -> str:
+    """Collection index type, cached for INDEX_TYPE_TTL_SECONDS; falls back to MILVUS_INDEX_TYPE."""
+    global _INDEX_TYPE
+
+    now = time.monotonic()
+    if _INDEX_TYPE is not None and _INDEX_TYPE[1] > now:
+        return _INDEX_TYPE[0]
+
+    try:
+        index_type = _describe_index_type() or properties.MILVUS_INDEX_TYPE
+    except Exception as e:
+        # Not cached: a transient failure must not pin the wrong type. With AUTO, Milvus picks defaults.
+        logger.warning(f"Could not describe vector index, using MILVUS_INDEX_TYPE: {e}")
+        return properties.MILVUS_INDEX_TYPE
+
+    _INDEX_TYPE = (index_type, now + INDEX_TYPE_TTL_SECONDS)
+    return index_type
+
+
 def recreate_collection():
+    global _INDEX_TYPE
+
     client: MilvusClient = milvus_store.client
     collection_name = properties.MILVUS_COLLECTION_NAME
 
@@ -60,14 +151,20 @@ def recreate_collection():
         logger.debug(f"release_collection skipped: {e}")
 
     # 2) Drop if exists
+    previous_row_count: int | None = None
     if client.has_collection(collection_name=collection_name):
+        try:
+            stats = client.get_collection_stats(collection_name=collection_name)
+            previous_row_count = int(stats.get("row_count", "0"))
+        except Exception as e:
+            logger.debug(f"get_collection_stats skipped: {e}")
         logger.warning(f"Collection '{collection_name}' already exists. Dropping it.")
         client.drop_collection(collection_name=collection_name)
         logger.info(f"Successfully dropped collection '{collection_name}'.")
 
     logger.info(f"Creating new collection: '{collection_name}'")
 
-    embedding_dim = len(milvus_store.embeddings.embed_query(TEXT_EMBEDDING_DIM))
+    embedding_dim = _embedding_dim()
 
     # Define schema
     schema = MilvusClient.create_schema(auto_id=True, enable_dynamic_field=True)
@@ -86,43 +183,66 @@ def recreate_collection():
 
     # Create an index for the vector field
     index_params = client.prepare_index_params()
+    index_type = resolve_index_type(previous_row_count)
     index_params.add_index(
         field_name="vector",
-        index_type="FLAT",
+        index_name="vector",
+        index_type=index_type,
         metric_type="COSINE",
-        params={},
+        params=index_build_params(index_type),
     )
     client.create_index(collection_name=collection_name, index_params=index_params)
-    logger.info("Successfully created index for the 'vector' field.")
+    logger.info(f"Successfully created {index_type} index for the 'vector' field.")
+    _INDEX_TYPE = (index_type, time.monotonic() + INDEX_TYPE_TTL_SECONDS)
 
     client.load_collection(collection_name=collection_name)
 
 
-def search_embeddings(query: str, top_k: int = 5):
-    vector = embedding_function.embed_query(query)
-
+def _search_vectors(vectors: List[List[float]], top_k: int) -> List[List[dict]]:
+    """One MilvusClient.search call for all vectors; returns a list of hits per vector."""
     results = milvus_store.client.search(
         collection_name=properties.MILVUS_COLLECTION_NAME,
-        data=[vector],
+        data=vectors,
         anns_field="vector",
         limit=top_k,
-        search_params={"metric_type": "COSINE"},
+        search_params={
+            "metric_type": "COSINE",
+            "params": index_search_params(_current_index_type(), top_k),
+        },
         output_fields=["text", "metadata"],
     )
 
+    # Format hit reprs only when INFO is actually emitted
+    log_hits = logger.isEnabledFor(logging.INFO)
+
     output = []
-    for hit in results[0]:
-        logger.info(f"{hit=}")
-        output.append({
-            "id": hit.id,
-            "distance": hit.distance,
-            "text": hit.entity.get("text"),
-            "metadata": hit.entity.get("metadata"),
-        })
+    for hits in results:
+        if log_hits:
+            for hit in hits:
+                logger.info("hit=%r", hit)
+        output.append([
+            {
+                "id": hit.id,
+                "distance": hit.distance,
+                "text": hit.entity.get("text"),
+                "metadata": hit.entity.get("metadata"),
+            }
+            for hit in hits
+        ])
 
     return output
 
 
+def search_embeddings(query: str, top_k: int = 5):
+    vector = embedding_function.embed_query(query)
+    return _search_vectors([vector], top_k)[0]
+
+
+async def search_embeddings_async(query: str, top_k: int = 5):
+    """Async search_embeddings: embed + search run in the shared thread pool."""
+    return await run_blocking(search_embeddings, query, top_k)
+
+
 def check_milvus_connection() -> bool:
     """Checks the Milvus database connection."""
     logger.info(f"Checking Milvus connection to {properties.MILVUS_DB_HOST}:{properties.MILVUS_DB_PORT}...")
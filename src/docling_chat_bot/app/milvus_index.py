@@ -0,0 +1,62 @@
+"""
+Vector index selection and index/search params for the Milvus collection.
+
+Kept free of Milvus and embeddings clients, so importing it never connects anywhere.
+"""
+from .config.config import properties
+
+# MILVUS_INDEX_TYPE=AUTO: from this corpus size on, HNSW beats FLAT on latency
+AUTO_INDEX_HNSW_MIN_ROWS = 100_000
+# Search params each index type understands; MILVUS_SEARCH_PARAMS keys are filtered by these
+_SEARCH_PARAM_KEYS: dict[str, frozenset[str]] = {
+    "HNSW": frozenset({"ef"}),
+    "IVF_SQ8": frozenset({"nprobe"}),
+    "FLAT": frozenset(),
+}
+
+
+def index_build_params(index_type: str) -> dict:
+    if index_type == "HNSW":
+        return {
+            "M": properties.MILVUS_HNSW_M,
+            "efConstruction": properties.MILVUS_HNSW_EF_CONSTRUCTION,
+        }
+    if index_type == "IVF_SQ8":
+        # The field stays FLOAT_VECTOR; Milvus quantizes vectors to int8 inside the index
+        return {"nlist": properties.MILVUS_IVF_NLIST}
+    return {}
+
+
+def index_search_params(index_type: str, top_k: int) -> dict:
+    if index_type == "HNSW":
+        params = {"ef": properties.MILVUS_HNSW_EF}
+    elif index_type == "IVF_SQ8":
+        params = {"nprobe": properties.MILVUS_IVF_NPROBE}
+    else:
+        params = {}
+
+    # MILVUS_SEARCH_PARAMS tunes recall/QPS without rebuilding the index. For known index
+    # types only their own keys apply, so an HNSW "ef" is not sent to IVF_SQ8 or FLAT.
+    override = properties.MILVUS_SEARCH_PARAMS or {}
+    allowed = _SEARCH_PARAM_KEYS.get(index_type)
+    params.update(
+        {k: v for k, v in override.items() if allowed is None or k in allowed}
+    )
+
+    if "ef" in params:
+        # ef must not be smaller than top_k
+        params["ef"] = max(int(params["ef"]), top_k)
+    return params
+
+
+def resolve_index_type(previous_row_count: int | None) -> str:
+    """
+    MILVUS_INDEX_TYPE=AUTO: FLAT for small corpora, HNSW from AUTO_INDEX_HNSW_MIN_ROWS rows.
+    The collection is recreated empty, so the dropped collection's size estimates the new corpus.
+    """
+    index_type = properties.MILVUS_INDEX_TYPE
+    if index_type != "AUTO":
+        return index_type
+    if previous_row_count is not None and previous_row_count >= AUTO_INDEX_HNSW_MIN_ROWS:
+        return "HNSW"
+    return "FLAT"
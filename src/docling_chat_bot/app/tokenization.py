@@ -1,30 +1,179 @@
-from typing import Any, Iterable, Sequence
-
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Iterable, Iterator, Sequence
+
+import httpx
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 from docling_core.transforms.chunker.tokenizer.base import BaseTokenizer
 from pydantic import ConfigDict, PrivateAttr
 
 from .config.config import properties
 from .logger import logger
 
+# Maximum number of concurrent tokenize API requests in batch counting
+TOKENIZE_MAX_CONCURRENCY = 16
+# Number of distinct texts kept in the tokenize result cache
+TOKENIZE_CACHE_SIZE = 8192
+
+YANDEX_TOKENIZE_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/tokenize"
+
+# How long a failed probe, connection error or timeout keeps the token API switched off
+ENDPOINT_RETRY_SECONDS = 30.0
+
+# Tokenize API reachability per api_url: (reachable, time.monotonic() expiry)
+_PROBED_ENDPOINTS: dict[str, tuple[bool, float]] = {}
+
+
+def _tokenize_timeouts() -> tuple[float, float]:
+    """Return (connect, read) tokenize API timeouts from settings."""
+
+    connect_timeout = max(0.25, float(properties.LLM_TOKENIZE_CONNECT_TIMEOUT or 1.0))
+    read_timeout = max(connect_timeout, float(properties.LLM_TOKENIZE_TIMEOUT or 3.0))
+    return connect_timeout, read_timeout
+
+
+def _probed_reachability(api_url: str) -> bool | None:
+    """Return the cached reachability of api_url, or None if it is unknown or expired."""
+
+    probe = _PROBED_ENDPOINTS.get(api_url)
+    if probe is None or probe[1] <= time.monotonic():
+        return None
+    return probe[0]
+
+
+def _record_reachability(api_url: str, reachable: bool) -> bool:
+    """Cache reachability of api_url; a negative result expires after ENDPOINT_RETRY_SECONDS."""
+
+    expires = math.inf if reachable else time.monotonic() + ENDPOINT_RETRY_SECONDS
+    _PROBED_ENDPOINTS[api_url] = (reachable, expires)
+    return reachable
+
+
+# Token counts per (api_url, text), least recently used first; shared by sync and async tokenizers
+_TOKEN_COUNTS: OrderedDict[tuple[str, str], int] = OrderedDict()
+_TOKEN_COUNTS_LOCK = threading.Lock()
+
+
+def _cached_token_count(api_url: str, text: str) -> int | None:
+    key = (api_url, text)
+    with _TOKEN_COUNTS_LOCK:
+        count = _TOKEN_COUNTS.get(key)
+        if count is not None:
+            _TOKEN_COUNTS.move_to_end(key)
+        return count
+
+
+def _remember_token_count(api_url: str, text: str, count: int) -> None:
+    key = (api_url, text)
+    with _TOKEN_COUNTS_LOCK:
+        _TOKEN_COUNTS[key] = count
+        _TOKEN_COUNTS.move_to_end(key)
+        if len(_TOKEN_COUNTS) > TOKENIZE_CACHE_SIZE:
+            _TOKEN_COUNTS.popitem(last=False)
+
+
+def _record_probe(api_url: str, status_code: int | None, exc: Exception | None = None) -> bool:
+    """Cache the outcome of a HEAD probe against api_url and return reachability."""
+
+    if exc is not None:
+        logger.warning(
+            "Yandex tokenize endpoint %s is unreachable: %s. Using word-based fallback.",
+            api_url,
+            exc,
+        )
+        return _record_reachability(api_url, False)
+    # Even 4xx (e.g., 404/405 Method Not Allowed) proves the host is reachable.
+    return _record_reachability(api_url, status_code is not None and status_code < 500)
+
+
+def _tokenize_payload(text: str) -> bytes | None:
+    if not properties.LLM_MODEL_NAME:
+        logger.warning(
+            "LLM_MODEL_NAME is not configured; falling back to naive token counting.",
+        )
+        return None
+    return orjson.dumps({"modelUri": properties.LLM_MODEL_NAME, "text": text})
+
+
+def _parse_tokens(content: bytes) -> list[str]:
+    """Extract the token list from a tokenize API response body.
+
+    Raises ValueError for bodies that are not a JSON object with a token list
+    (e.g., a proxy's HTML error page served with 200); orjson.JSONDecodeError
+    is a ValueError subclass.
+    """
+
+    body = orjson.loads(content)
+    if not isinstance(body, dict):
+        raise ValueError(f"unexpected tokenize response: {type(body).__name__}")
+    tokens = body.get("tokens", [])
+    if not isinstance(tokens, list):
+        raise ValueError(f"unexpected tokens field: {type(tokens).__name__}")
+    return tokens
+
+
+def _count_from_tokens(api_url: str, text: str, tokens: list[str]) -> int:
+    if not tokens:
+        return len(text.split())
+    _remember_token_count(api_url, text, len(tokens))
+    return len(tokens)
+
+
+def _tokenize_failed(api_url: str, text: str, exc: Exception, endpoint_down: bool) -> int:
+    """Log a failed tokenize request and return the word-based fallback count.
+
+    Connection errors and timeouts switch the token API off for ENDPOINT_RETRY_SECONDS;
+    HTTP error responses (4xx/429) and malformed bodies prove the endpoint is up and
+    only affect this text.
+    """
+
+    if endpoint_down:
+        logger.warning(
+            "Yandex tokenize endpoint failed: %s. Falling back to word-based counting "
+            "and disabling token API for %ss.",
+            exc,
+            ENDPOINT_RETRY_SECONDS,
+        )
+        _record_reachability(api_url, False)
+    else:
+        logger.warning(
+            "Error in Yandex token counting: %s. Falling back to word-based counting for this text.",
+            exc,
+        )
+    return len(text.split())
+
+
+def _auth_headers() -> dict[str, str]:
+    return {
+        "Authorization": f"Bearer {properties.LLM_API_KEY}",
+        "Content-Type": "application/json",
+    }
+
 
 class YandexTokenizer(BaseTokenizer):
     """Tokenizer implementation backed by Yandex's tokenize API."""
 
     model_config = ConfigDict(arbitrary_types_allowed=True, extra="allow")
 
-    api_url: str = "https://llm.api.cloud.yandex.net/foundationModels/v1/tokenize"
+    api_url: str = YANDEX_TOKENIZE_URL
 
-    _endpoint_reachable: bool | None = PrivateAttr(default=None)
     _connect_timeout: float = PrivateAttr(default=1.0)
     _read_timeout: float = PrivateAttr(default=3.0)
+    # Shared session: keep-alive and a connection pool across tokenize requests
+    _session: requests.Session = PrivateAttr(default_factory=requests.Session)
 
     def __init__(self) -> None:
         super().__init__()
-        connect_timeout = max(0.25, float(properties.LLM_TOKENIZE_CONNECT_TIMEOUT or 1.0))
-        read_timeout = max(connect_timeout, float(properties.LLM_TOKENIZE_TIMEOUT or 3.0))
-        self._connect_timeout = connect_timeout
-        self._read_timeout = read_timeout
+        self._connect_timeout, self._read_timeout = _tokenize_timeouts()
+        self._session.mount("https://", HTTPAdapter(pool_maxsize=TOKENIZE_MAX_CONCURRENCY))
+        self._session.headers.update(_auth_headers())
 
     @property
     def timeout_seconds(self) -> float:
@@ -43,68 +192,62 @@ class YandexTokenizer(BaseTokenizer):
     def _is_api_reachable(self) -> bool:
         """Cheap reachability probe to avoid hanging on a dead endpoint."""
 
-        if self._endpoint_reachable is not None:
-            return self._endpoint_reachable
+        reachable = _probed_reachability(self.api_url)
+        if reachable is not None:
+            return reachable
 
         try:
-            response = requests.get(self.api_url, timeout=self.timeout)
-            # Even 4xx (e.g., 405 Method Not Allowed) proves the host is reachable.
-            reachable = response.status_code < 500
-        except requests.RequestException as exc:
-            logger.warning(
-                "Yandex tokenize endpoint %s is unreachable: %s. Using word-based fallback.",
+            # HEAD has no body, so the read timeout is capped at the connect timeout
+            response = self._session.head(
                 self.api_url,
-                exc,
+                timeout=(self._connect_timeout, self._connect_timeout),
+                allow_redirects=False,
             )
-            reachable = False
-
-        self._endpoint_reachable = reachable
-        return reachable
+        except requests.RequestException as exc:
+            return _record_probe(self.api_url, None, exc)
+        return _record_probe(self.api_url, response.status_code)
 
     def _tokenize_via_api(self, text: str) -> list[str]:
-        if not properties.LLM_MODEL_NAME:
-            logger.warning(
-                "LLM_MODEL_NAME is not configured; falling back to naive token counting.",
-            )
+        payload = _tokenize_payload(text)
+        if payload is None:
             return []
 
-        headers = {
-            "Authorization": f"Bearer {properties.LLM_API_KEY}",
-            "Content-Type": "application/json",
-        }
-        payload = {"modelUri": properties.LLM_MODEL_NAME, "text": text}
-
-        response = requests.post(
-            self.api_url, headers=headers, json=payload, timeout=self.timeout
-        )
+        response = self._session.post(self.api_url, data=payload, timeout=self.timeout)
         response.raise_for_status()
-        return response.json().get("tokens", [])
+        return _parse_tokens(response.content)
 
     def count_tokens(self, text: str) -> int:  # type: ignore[override]
         """Get number of tokens for given text."""
 
-        try:
-            if not self._is_api_reachable():
-                return len(text.split())
+        cached = _cached_token_count(self.api_url, text)
+        if cached is not None:
+            return cached
 
-            tokens = self._tokenize_via_api(text)
-            return len(tokens) if tokens else len(text.split())
-        except requests.Timeout:
-            logger.warning(
-                "Yandex tokenization timed out after %ss; disabling token API for this run.",
-                self.timeout_seconds,
-            )
-            self._endpoint_reachable = False
-            return len(text.split())
-        except requests.RequestException as exc:  # pragma: no cover - network fallback
-            logger.error(
-                "Error in Yandex token counting: %s. Falling back to word-based counting and disabling token API for this run.",
-                exc,
-                exc_info=True,
-            )
-            self._endpoint_reachable = False
+        if not self._is_api_reachable():
             return len(text.split())
 
+        try:
+            tokens = self._tokenize_via_api(text)
+        except (requests.RequestException, ValueError) as exc:  # pragma: no cover - network fallback
+            endpoint_down = isinstance(exc, (requests.ConnectionError, requests.Timeout))
+            return _tokenize_failed(self.api_url, text, exc, endpoint_down)
+        return _count_from_tokens(self.api_url, text, tokens)
+
+    def count_tokens_batch(self, texts: Sequence[str]) -> list[int]:
+        """Get number of tokens for each text; API calls are issued concurrently."""
+
+        # Repeated fragments (e.g., identical system prompts) are requested once
+        unique = list(dict.fromkeys(texts))
+
+        if len(unique) <= 1 or not self._is_api_reachable():
+            counts = [self.count_tokens(text) for text in unique]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(unique), TOKENIZE_MAX_CONCURRENCY)) as executor:
+                counts = list(executor.map(self.count_tokens, unique))
+
+        by_text = dict(zip(unique, counts))
+        return [by_text[text] for text in texts]
+
     def get_max_tokens(self) -> int:  # type: ignore[override]
         """Get maximum number of tokens allowed."""
 
@@ -116,17 +259,105 @@ class YandexTokenizer(BaseTokenizer):
         return None
 
 
-def _count_content_tokens(content: Any, tokenizer: BaseTokenizer) -> int:
+class AsyncYandexTokenizer:
+    """Async variant of YandexTokenizer for event-loop code.
+
+    Uses one pooled HTTP/2 ``httpx.AsyncClient``, so concurrent tokenize
+    requests are multiplexed over shared connections instead of threads.
+    YandexTokenizer stays the implementation used by docling's sync chunker.
+    """
+
+    api_url: str = YANDEX_TOKENIZE_URL
+
+    def __init__(self) -> None:
+        connect_timeout, read_timeout = _tokenize_timeouts()
+        self._connect_timeout = connect_timeout
+        self._client = httpx.AsyncClient(
+            http2=True,
+            headers=_auth_headers(),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_keepalive_connections=32),
+        )
+
+    async def _is_api_reachable(self) -> bool:
+        reachable = _probed_reachability(self.api_url)
+        if reachable is not None:
+            return reachable
+
+        try:
+            response = await self._client.head(
+                self.api_url,
+                timeout=httpx.Timeout(self._connect_timeout),
+            )
+        except httpx.HTTPError as exc:
+            return _record_probe(self.api_url, None, exc)
+        return _record_probe(self.api_url, response.status_code)
+
+    async def _tokenize_via_api(self, text: str) -> list[str]:
+        payload = _tokenize_payload(text)
+        if payload is None:
+            return []
+
+        response = await self._client.post(self.api_url, content=payload)
+        response.raise_for_status()
+        return _parse_tokens(response.content)
+
+    async def count_tokens(self, text: str) -> int:
+        """Get number of tokens for given text."""
+
+        cached = _cached_token_count(self.api_url, text)
+        if cached is not None:
+            return cached
+
+        if not await self._is_api_reachable():
+            return len(text.split())
+
+        try:
+            tokens = await self._tokenize_via_api(text)
+        except (httpx.HTTPError, ValueError) as exc:
+            endpoint_down = isinstance(exc, httpx.TransportError)
+            return _tokenize_failed(self.api_url, text, exc, endpoint_down)
+        return _count_from_tokens(self.api_url, text, tokens)
+
+    async def count_tokens_batch(self, texts: Sequence[str]) -> list[int]:
+        """Get number of tokens for each text; requests are multiplexed with asyncio.gather."""
+
+        unique = list(dict.fromkeys(texts))
+        semaphore = asyncio.Semaphore(TOKENIZE_MAX_CONCURRENCY)
+
+        async def _count(text: str) -> int:
+            async with semaphore:
+                return await self.count_tokens(text)
+
+        counts = await asyncio.gather(*(_count(text) for text in unique))
+        by_text = dict(zip(unique, counts))
+        return [by_text[text] for text in texts]
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+@lru_cache(maxsize=1)
+def _shared_tokenizer() -> YandexTokenizer:
+    """One tokenizer (and one HTTP session) per process for message token counting."""
+
+    return YandexTokenizer()
+
+
+def _collect_strings(content: Any) -> Iterator[str]:
     if content is None:
-        return 0
+        return
     if isinstance(content, str):
-        return tokenizer.count_tokens(content)
+        yield content
+        return
     if isinstance(content, dict):
-        text = content.get("text") or content.get("content") or str(content)
-        return tokenizer.count_tokens(text)
+        yield content.get("text") or content.get("content") or str(content)
+        return
     if isinstance(content, Iterable) and not isinstance(content, (str, bytes)):
-        return sum(_count_content_tokens(item, tokenizer) for item in content)
-    return tokenizer.count_tokens(str(content))
+        for item in content:
+            yield from _collect_strings(item)
+        return
+    yield str(content)
 
 
 def count_token_in_messages(messages: Sequence[Any]) -> int:
@@ -134,12 +365,15 @@ def count_token_in_messages(messages: Sequence[Any]) -> int:
 
     Each message is expected to expose a ``content`` attribute which can be
     either a string, a list (for hierarchical content), or a mapping with a
-    ``text``/``content`` field.
+    ``text``/``content`` field. All text fragments are collected first and
+    tokenized in one concurrent batch.
     """
 
-    tokenizer = YandexTokenizer()
-    total = 0
-    for message in messages:
-        content = getattr(message, "content", None)
-        total += _count_content_tokens(content, tokenizer)
-    return total
+    tokenizer = _shared_tokenizer()
+    texts = [
+        text
+        for message in messages
+        for text in _collect_strings(getattr(message, "content", None))
+    ]
+    return sum(tokenizer.count_tokens_batch(texts))
+
@@ -0,0 +1,19 @@
+import os
+
+# Settings has required fields; tests only need them to be present, not real
+for name, value in {
+    "SERVER_HOST": "127.0.0.1",
+    "SERVER_PORT": "8000",
+    "MILVUS_DB_HOST": "http://localhost",
+    "MILVUS_DB_PORT": "19530",
+    "MILVUS_DB_NAME": "default",
+    "MILVUS_COLLECTION_NAME": "test_collection",
+    "MILVUS_PASSWORD": "test",
+    "LLM_API_KEY": "test",
+    "LLM_MODEL_NAME": "gpt://test/yandexgpt-lite",
+    "LLM_CATALOG_ID_YANDEX": "test",
+    "POSTGRES_DB": "test",
+    "POSTGRES_USER": "test",
+    "POSTGRES_PASSWORD": "test",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+from pydantic import BaseModel
+
+from docling_chat_bot.app.doc_processor import _extract_metadata, chunks_to_rows
+
+
+class _Meta(BaseModel):
+    headings: list[str] | None = None
+    doc_items: list[str] = []
+    origin: str | None = None
+
+
+class _Chunk(BaseModel):
+    text: str
+    meta: _Meta
+    doc_items: list[str] = []
+
+
+def test_extract_metadata_from_pydantic_chunk_drops_heavy_fields():
+    chunk = _Chunk(
+        text="body",
+        meta=_Meta(headings=["1 ", " 1.2"], doc_items=["x"], origin="o"),
+        doc_items=["x"],
+    )
+
+    meta = _extract_metadata(chunk, 3, document_name="doc.docx")
+
+    assert meta["headings"] == ["1", "1.2"]
+    assert meta["chunk_index"] == 3
+    assert meta["document_name"] == "doc.docx"
+    assert meta["source"] == "docling_upload"
+    assert "doc_items" not in meta
+    assert meta["meta"] == {"headings": ["1 ", " 1.2"]}
+
+
+def test_extract_metadata_from_plain_object_stringifies_non_json_values():
+    chunk = SimpleNamespace(text="body", origin="skip", payload={1, 2}, size=4)
+
+    meta = _extract_metadata(chunk, 0, document_name="doc.docx")
+
+    assert "origin" not in meta
+    assert meta["size"] == 4
+    assert meta["payload"] == str({1, 2})
+    assert meta["headings"] == []
+
+
+def test_chunks_to_rows_skips_empty_chunks_but_keeps_indexes():
+    chunks = [
+        SimpleNamespace(text="  first  "),
+        SimpleNamespace(text="   "),
+        SimpleNamespace(text="third"),
+    ]
+
+    texts, metadatas = chunks_to_rows(chunks, "doc.docx")
+
+    assert texts == ["first", "third"]
+    assert [m["chunk_index"] for m in metadatas] == [0, 2]
+    assert {m["document_name"] for m in metadatas} == {"doc.docx"}
+
+
+def test_chunks_to_rows_empty_document():
+    assert chunks_to_rows([], "doc.docx") == ([], [])
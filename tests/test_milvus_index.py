@@ -0,0 +1,66 @@
+import pytest
+
+from docling_chat_bot.app.config.config import properties
+from docling_chat_bot.app.milvus_index import (
+    AUTO_INDEX_HNSW_MIN_ROWS,
+    index_search_params,
+    resolve_index_type,
+)
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    monkeypatch.setattr(properties, "MILVUS_SEARCH_PARAMS", None)
+    monkeypatch.setattr(properties, "MILVUS_HNSW_EF", 64)
+    monkeypatch.setattr(properties, "MILVUS_IVF_NPROBE", 16)
+    return monkeypatch
+
+
+@pytest.mark.parametrize(
+    ("previous_row_count", "expected"),
+    [
+        (None, "FLAT"),
+        (0, "FLAT"),
+        (AUTO_INDEX_HNSW_MIN_ROWS - 1, "FLAT"),
+        (AUTO_INDEX_HNSW_MIN_ROWS, "HNSW"),
+    ],
+)
+def test_resolve_index_type_auto_by_corpus_size(settings, previous_row_count, expected):
+    settings.setattr(properties, "MILVUS_INDEX_TYPE", "AUTO")
+
+    assert resolve_index_type(previous_row_count) == expected
+
+
+def test_resolve_index_type_keeps_explicit_type(settings):
+    settings.setattr(properties, "MILVUS_INDEX_TYPE", "IVF_SQ8")
+
+    assert resolve_index_type(AUTO_INDEX_HNSW_MIN_ROWS) == "IVF_SQ8"
+
+
+def test_search_params_defaults_per_index_type(settings):
+    assert index_search_params("HNSW", top_k=5) == {"ef": 64}
+    assert index_search_params("IVF_SQ8", top_k=5) == {"nprobe": 16}
+    assert index_search_params("FLAT", top_k=5) == {}
+
+
+def test_search_params_ef_is_raised_to_top_k(settings):
+    assert index_search_params("HNSW", top_k=100) == {"ef": 100}
+
+
+def test_search_params_override_merges_and_keeps_ef_clamp(settings):
+    settings.setattr(properties, "MILVUS_SEARCH_PARAMS", {"ef": 8})
+
+    assert index_search_params("HNSW", top_k=20) == {"ef": 20}
+
+
+def test_search_params_override_drops_keys_of_other_index_types(settings):
+    settings.setattr(properties, "MILVUS_SEARCH_PARAMS", {"ef": 128, "nprobe": 32})
+
+    assert index_search_params("IVF_SQ8", top_k=5) == {"nprobe": 32}
+    assert index_search_params("FLAT", top_k=5) == {}
+
+
+def test_search_params_override_passes_through_for_unknown_index_type(settings):
+    settings.setattr(properties, "MILVUS_SEARCH_PARAMS", {"nprobe": 8})
+
+    assert index_search_params("IVF_FLAT", top_k=5) == {"nprobe": 8}
@@ -0,0 +1,49 @@
+import pytest
+
+from docling_chat_bot.app import tokenization
+
+
+@pytest.fixture(autouse=True)
+def _empty_token_cache():
+    tokenization._TOKEN_COUNTS.clear()
+    yield
+    tokenization._TOKEN_COUNTS.clear()
+
+
+def test_parse_tokens_returns_token_list():
+    assert tokenization._parse_tokens(b'{"tokens": ["a", "b"]}') == ["a", "b"]
+
+
+def test_parse_tokens_missing_field_is_empty():
+    assert tokenization._parse_tokens(b"{}") == []
+
+
+@pytest.mark.parametrize(
+    "body",
+    [b"<html>Bad Gateway</html>", b"[1, 2]", b'{"tokens": 3}'],
+)
+def test_parse_tokens_rejects_malformed_body_with_value_error(body):
+    with pytest.raises(ValueError):
+        tokenization._parse_tokens(body)
+
+
+def test_token_cache_is_keyed_by_api_url():
+    tokenization._remember_token_count("https://a", "text", 3)
+
+    assert tokenization._cached_token_count("https://a", "text") == 3
+    assert tokenization._cached_token_count("https://b", "text") is None
+
+
+def test_token_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(tokenization, "TOKENIZE_CACHE_SIZE", 2)
+
+    tokenization._remember_token_count("u", "first", 1)
+    tokenization._remember_token_count("u", "second", 2)
+    # A hit refreshes "first", so "second" becomes the oldest entry
+    assert tokenization._cached_token_count("u", "first") == 1
+    tokenization._remember_token_count("u", "third", 3)
+
+    assert tokenization._cached_token_count("u", "second") is None
+    assert tokenization._cached_token_count("u", "first") == 1
+    assert tokenization._cached_token_count("u", "third") == 3
+    assert len(tokenization._TOKEN_COUNTS) == 2